@@ -1,15 +1,27 @@
 import atexit
-import json
+import copy
+import hashlib
+import mimetypes
 import os
+import queue
+import secrets
 import ssl
 import tempfile
-import uuid
-from datetime import datetime
-from functools import wraps
-
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import lru_cache, wraps
+from operator import itemgetter
+
+import orjson
 from flask import (
     Flask,
+    abort,
     flash,
+    g,
+    has_request_context,
+    make_response,
     redirect,
     render_template,
     request,
@@ -17,11 +29,13 @@ from flask import (
     session,
     url_for,
 )
-from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import check_password_hash, generate_password_hash, safe_join
 from werkzeug.utils import secure_filename
 
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB hard limit to avoid abuse
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB copy buffer for uploads
 ALLOWED_JOURNAL_EXTENSIONS = {"pdf"}
 ALLOWED_ASSET_EXTENSIONS = {
     "pdf",
@@ -38,6 +52,16 @@ ALLOWED_ASSET_EXTENSIONS = {
     "pptx",
 }
 ALLOWED_IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
+WRITE_COALESCE_DELAY = 0.05  # seconds to batch saves before writing
+WRITE_RETRY_INTERVAL = 1.0  # seconds between write retries
+WRITE_BUFFER_SIZE = 64 * 1024
+LOG_COMPACT_MIN_ENTRIES = 100  # never compact a change log shorter than this
+fsync_writes = False  # set from config "fsync_writes" once it is loaded
+LOGIN_MAX_ATTEMPTS = 5  # failed passwords per client and username before a pause
+LOGIN_MAX_CLIENT_ATTEMPTS = 50  # failed passwords per client address, any username
+LOGIN_LOCKOUT_SECONDS = 5 * 60
+PASSWORD_SCRYPT_N = 2**15  # Werkzeug's default cost; never go below it
+PASSWORD_HASH_METHOD = f"scrypt:{PASSWORD_SCRYPT_N}:8:1"
 
 DEFAULT_WIDGETS = [
     {
@@ -78,15 +102,95 @@ DEFAULT_WIDGETS = [
     },
 ]
 
+DEFAULT_RULES = {"content": "Defina aqui as regras de convivência do jornal.", "updated_at": None}
+
+DEFAULT_SITE_SETTINGS = {
+    "logo_url": "",
+    "logo_file": None,
+    "primary_color": "#0d6efd",
+    "accent_color": "#6610f2",
+    "tagline": "Painel interno do jornal escolar",
+    "onboarding_done": False,
+    "widgets": DEFAULT_WIDGETS,
+}
+
+DEFAULT_ROLES = [
+    {
+        "name": "Administrador",
+        "description": "Acesso total ao painel e configurações",
+        "permissions": [
+            "manage_students",
+            "manage_journals",
+            "manage_assets",
+            "manage_rules",
+            "manage_announcements",
+            "manage_calendar",
+            "manage_departments",
+            "approve_departments",
+            "manage_settings",
+            "manage_roles",
+            "manage_users",
+            "manage_tickets",
+        ],
+    },
+    {
+        "name": "Gerente",
+        "description": "Cuida de pessoas, calendários e arquivos",
+        "permissions": [
+            "manage_students",
+            "manage_assets",
+            "manage_calendar",
+            "manage_announcements",
+            "manage_departments",
+            "manage_tickets",
+        ],
+    },
+    {
+        "name": "Diretor de Departamento",
+        "description": "Aprova filas e acompanha entregas do time",
+        "permissions": [
+            "manage_assets",
+            "manage_calendar",
+            "approve_departments",
+            "manage_tickets",
+        ],
+    },
+    {
+        "name": "Colaborador",
+        "description": "Acesso apenas para consultar materiais",
+        "permissions": [],
+    },
+]
+
+
+def write_file_atomic(path, payload):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb", buffering=WRITE_BUFFER_SIZE) as file:
+        file.write(payload)
+        if fsync_writes:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+def needs_rehash(password_hash):
+    method, *params = password_hash.split("$", 1)[0].split(":")
+    if method != "scrypt":
+        return True
+    return int(params[0]) < PASSWORD_SCRYPT_N if params else False
+
 
 def load_config():
-    with open(CONFIG_PATH, "r", encoding="utf-8") as config_file:
-        return json.load(config_file)
+    with open(CONFIG_PATH, "rb") as config_file:
+        return orjson.loads(config_file.read())
 
 
 def save_config(config_data):
-    with open(CONFIG_PATH, "w", encoding="utf-8") as config_file:
-        json.dump(config_data, config_file, ensure_ascii=False, indent=2)
+    write_file_atomic(CONFIG_PATH, orjson.dumps(config_data, option=orjson.OPT_INDENT_2))
 
 
 def ensure_admin_password_hashes(config_data):
@@ -94,7 +198,7 @@ def ensure_admin_password_hashes(config_data):
     for admin in config_data.get("admin_users", []):
         plaintext = admin.pop("password", None)
         if plaintext:
-            admin["password_hash"] = generate_password_hash(plaintext)
+            admin["password_hash"] = hash_password(plaintext)
             changed = True
     if changed:
         save_config(config_data)
@@ -103,15 +207,203 @@ def ensure_admin_password_hashes(config_data):
 
 def ensure_data_file(path, default):
     if not os.path.exists(path):
-        with open(path, "w", encoding="utf-8") as file:
-            json.dump(default, file, ensure_ascii=False, indent=2)
-    with open(path, "r", encoding="utf-8") as file:
-        return json.load(file)
+        write_file_atomic(path, orjson.dumps(default, option=orjson.OPT_INDENT_2))
+        return copy.deepcopy(default)  # the defaults are shared constants
+    with open(path, "rb") as file:
+        return orjson.loads(file.read())
+
+
+def data_json_option():
+    option = orjson.OPT_NON_STR_KEYS
+    if config.get("debug"):
+        option |= orjson.OPT_INDENT_2
+    return option
+
+
+class JsonStore:
+    def __init__(self, delay):
+        self.delay = delay
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeups = queue.Queue()
+        threading.Thread(target=self._run, name="json-store", daemon=True).start()
+
+    def mark_dirty(self, path, payload):
+        with self._lock:
+            self._pending[path] = payload
+        self._wakeups.put(path)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for path, payload in pending.items():
+                try:
+                    self._write(path, payload)
+                except OSError as exc:
+                    print(f"Erro ao gravar {path}: {exc}")
+                    with self._lock:
+                        self._pending.setdefault(path, payload)
+
+    @staticmethod
+    def _write(path, payload):
+        write_file_atomic(path, payload)
+
+    def _run(self):
+        while True:
+            try:
+                self._wakeups.get(timeout=WRITE_RETRY_INTERVAL)
+            except queue.Empty:
+                if not self._pending:
+                    continue
+            time.sleep(self.delay)
+            while not self._wakeups.empty():
+                self._wakeups.get_nowait()
+            self.flush()
+
+
+data_store = JsonStore(WRITE_COALESCE_DELAY)
+atexit.register(data_store.flush)
+data_version = 0  # bumped on every save
+collection_versions = {}  # id(list) -> version of its last save
+
+
+def mark_data_changed(collection):
+    global data_version
+    data_version += 1
+    collection_versions[id(collection)] = data_version
+
+
+_saved_digests = {}
+_save_lock = threading.Lock()
 
 
 def save_data(path, data):
-    with open(path, "w", encoding="utf-8") as file:
-        json.dump(data, file, ensure_ascii=False, indent=2)
+    with _save_lock:
+        payload = orjson.dumps(data, option=data_json_option())
+        digest = hashlib.blake2b(payload, digest_size=16).digest()
+        if _saved_digests.get(path) == digest:
+            return
+        _saved_digests[path] = digest
+        data_store.mark_dirty(path, payload)
+    mark_data_changed(data)
+
+
+class CollectionLog:
+    def __init__(self, path, records):
+        self.path = path
+        self.log_path = f"{path}.log"
+        self.records = records
+        self.entries = 0
+        self._handle = None
+        self._lock = threading.Lock()
+
+    def replay(self):
+        if not os.path.exists(self.log_path):
+            return
+        by_id = {record.get("id"): record for record in self.records}
+        good_end = 0
+        with open(self.log_path, "r+b") as log_file:
+            for line in log_file:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # Torn last line: cut it off so the next append starts on a clean line.
+                    log_file.truncate(good_end)
+                    break
+                if entry.get("op") == "upsert":
+                    by_id[entry["id"]] = entry["rec"]
+                elif entry.get("op") == "delete":
+                    by_id.pop(entry["id"], None)
+                self.entries += 1
+                good_end += len(line)
+                if not line.endswith(b"\n"):
+                    log_file.write(b"\n")  # complete record that lost its newline
+        self.records[:] = by_id.values()
+
+    def upsert(self, record):
+        self._append({"op": "upsert", "id": record["id"], "rec": record})
+
+    def delete(self, record_id):
+        self._append({"op": "delete", "id": record_id})
+
+    def _append(self, entry):
+        with self._lock:
+            line = orjson.dumps(entry, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+            if self._handle is None:
+                self._handle = open(self.log_path, "ab", buffering=WRITE_BUFFER_SIZE)
+            self._handle.write(line)
+            self.entries += 1
+            needs_compaction = self.entries > max(LOG_COMPACT_MIN_ENTRIES, len(self.records))
+        mark_data_changed(self.records)
+        if needs_compaction:
+            self.compact()
+        elif has_request_context():
+            g.setdefault("dirty_logs", set()).add(self)
+        else:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.flush()
+                if fsync_writes:
+                    os.fsync(self._handle.fileno())
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+    def compact(self):
+        with self._lock:
+            write_file_atomic(self.path, orjson.dumps(self.records, option=data_json_option()))
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+            if os.path.exists(self.log_path):
+                os.remove(self.log_path)
+            self.entries = 0
+
+
+_iso_second = (None, "")
+
+
+def iso_now():
+    global _iso_second
+    second, nanoseconds = divmod(time.time_ns(), 1_000_000_000)
+    cached_second, prefix = _iso_second
+    if second != cached_second:
+        prefix = datetime.fromtimestamp(second, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        _iso_second = (second, prefix)
+    return f"{prefix}.{nanoseconds // 1000:06d}"
+
+
+def request_now():
+    if not has_request_context():
+        return iso_now()
+    if "now" not in g:
+        g.now = iso_now()
+    return g.now
+
+
+def new_id():
+    return secrets.token_hex(16)
+
+
+def name_sort_key(name):
+    return (name or "").lower()
+
+
+def set_sort_key(record):
+    record["sort_key"] = name_sort_key(record.get("name"))
+
+
+def index_by(collection, field="id"):
+    return {item.get(field): item for item in collection if item.get(field)}
 
 
 def login_required(view):
@@ -133,8 +425,7 @@ def require_permission(permission):
             if not user:
                 flash("Sessão expirada", "warning")
                 return redirect(url_for("login"))
-            permissions = user.get("permissions", [])
-            if permission not in permissions:
+            if permission not in session_permissions(user):
                 flash("Você não tem permissão para essa ação", "danger")
                 return redirect(url_for("dashboard"))
             return view(**kwargs)
@@ -150,8 +441,39 @@ def allowed_file(filename, allowed_extensions):
     return filename.rsplit(".", 1)[1].lower() in allowed_extensions
 
 
+def save_upload(file, destination):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(destination, "wb", buffering=UPLOAD_CHUNK_SIZE) as out:
+        while chunk := file.stream.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+
+def send_upload(folder, filename):
+    prefix = config.get("x_accel_redirect_prefix")
+    if not prefix:
+        return send_from_directory(folder, filename, conditional=True)
+    path = safe_join(os.path.join(app.root_path, folder), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    response = app.response_class(
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    )
+    response.headers["X-Accel-Redirect"] = f"{prefix.rstrip('/')}/{os.path.basename(folder)}/{filename}"
+    return response
+
+
 def find_user_by_username(username):
-    return next((u for u in users if u.get("username") == username), None)
+    return users_by_username.get(username)
+
+
+def set_username(user, username):
+    previous = user.get("username")
+    if previous and users_by_username.get(previous) is user:
+        del users_by_username[previous]
+    user["username"] = username
+    users_by_username[username] = user
 
 
 def link_portal_user(student, username, password, role_name, enabled=True):
@@ -161,38 +483,61 @@ def link_portal_user(student, username, password, role_name, enabled=True):
     if existing and existing.get("id") != student.get("user_id"):
         raise ValueError("Usuário já existe. Escolha outro nome de usuário.")
     if student.get("user_id"):
-        user = next((u for u in users if u.get("id") == student.get("user_id")), None)
+        user = users_by_id.get(student.get("user_id"))
     else:
         user = None
     if user is None:
-        user = {"id": str(uuid.uuid4()), "created_at": datetime.utcnow().isoformat()}
+        user = {"id": new_id(), "created_at": request_now()}
         users.append(user)
+        users_by_id[user["id"]] = user
+    set_username(user, username)
     user.update(
         {
             "name": student.get("name"),
-            "username": username,
             "role": role_name,
-            "password_hash": generate_password_hash(password) if password else user.get("password_hash"),
+            "password_hash": hash_password(password) if password else user.get("password_hash"),
             "portal_enabled": enabled,
             "linked_student_id": student.get("id"),
             "status": student.get("status", "approved"),
         }
     )
+    set_sort_key(user)
     if password is None and not user.get("password_hash"):
         raise ValueError("Defina uma senha para o portal")
     student["user_id"] = user.get("id")
-    save_data(users_path, users)
+    users_log.upsert(user)
     return user
 
 
 config = ensure_admin_password_hashes(load_config())
+fsync_writes = bool(config.get("fsync_writes"))
+admins_by_username = index_by(config.get("admin_users", []), "username")
+DUMMY_PASSWORD_HASH = hash_password(secrets.token_hex(16))
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET", "dev-secret-key")
+if config.get("proxy_count"):
+    proxy_count = int(config["proxy_count"])
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_count, x_proto=proxy_count)
+session_redis_url = config.get("session_redis_url") or os.environ.get("SESSION_REDIS_URL")
+if session_redis_url:
+    try:
+        import redis
+        from flask_session import Session
+
+        app.config["SESSION_TYPE"] = "redis"
+        app.config["SESSION_REDIS"] = redis.Redis.from_url(session_redis_url)
+        Session(app)
+    except ImportError:
+        print(
+            "Aviso: 'session_redis_url' configurado, mas os pacotes 'Flask-Session' e 'redis' não estão instalados.\n"
+            "Mantendo as sessões em cookie assinado."
+        )
 app.config["UPLOAD_FOLDER_JOURNALS"] = os.path.join("uploads", "journals")
 app.config["UPLOAD_FOLDER_ASSETS"] = os.path.join("uploads", "assets")
 app.config["UPLOAD_FOLDER_LOGOS"] = os.path.join("uploads", "logos")
 app.config["UPLOAD_FOLDER_PHOTOS"] = os.path.join("uploads", "photos")
 app.config["MAX_CONTENT_LENGTH"] = MAX_FILE_SIZE
+app.config["USE_X_SENDFILE"] = bool(config.get("use_x_sendfile"))
 
 os.makedirs(app.config["UPLOAD_FOLDER_JOURNALS"], exist_ok=True)
 os.makedirs(app.config["UPLOAD_FOLDER_ASSETS"], exist_ok=True)
@@ -211,27 +556,61 @@ roles_path = os.path.join("data", "roles.json")
 users_path = os.path.join("data", "users.json")
 tickets_path = os.path.join("data", "tickets.json")
 
-students = ensure_data_file(students_path, [])
-journals = ensure_data_file(journals_path, [])
-assets = ensure_data_file(assets_path, [])
-rules = ensure_data_file(
-    rules_path, {"content": "Defina aqui as regras de convivência do jornal.", "updated_at": None}
-)
-announcements = ensure_data_file(announcements_path, [])
-calendar_events = ensure_data_file(calendar_path, [])
-departments = ensure_data_file(departments_path, [])
-site_settings = ensure_data_file(
-    site_settings_path,
-    {
-        "logo_url": "",
-        "logo_file": None,
-        "primary_color": "#0d6efd",
-        "accent_color": "#6610f2",
-        "tagline": "Painel interno do jornal escolar",
-        "onboarding_done": False,
-        "widgets": DEFAULT_WIDGETS,
-    },
-)
+data_files = {
+    "students": (students_path, []),
+    "journals": (journals_path, []),
+    "assets": (assets_path, []),
+    "rules": (rules_path, DEFAULT_RULES),
+    "announcements": (announcements_path, []),
+    "calendar": (calendar_path, []),
+    "departments": (departments_path, []),
+    "site_settings": (site_settings_path, DEFAULT_SITE_SETTINGS),
+    "roles": (roles_path, DEFAULT_ROLES),
+    "users": (users_path, []),
+    "tickets": (tickets_path, []),
+}
+with ThreadPoolExecutor(max_workers=8) as executor:
+    loading = {
+        name: executor.submit(ensure_data_file, path, default)
+        for name, (path, default) in data_files.items()
+    }
+students = loading["students"].result()
+journals = loading["journals"].result()
+assets = loading["assets"].result()
+rules = loading["rules"].result()
+announcements = loading["announcements"].result()
+calendar_events = loading["calendar"].result()
+departments = loading["departments"].result()
+site_settings = loading["site_settings"].result()
+roles = loading["roles"].result()
+users = loading["users"].result()
+tickets = loading["tickets"].result()
+
+students_log = CollectionLog(students_path, students)
+journals_log = CollectionLog(journals_path, journals)
+assets_log = CollectionLog(assets_path, assets)
+announcements_log = CollectionLog(announcements_path, announcements)
+calendar_log = CollectionLog(calendar_path, calendar_events)
+departments_log = CollectionLog(departments_path, departments)
+users_log = CollectionLog(users_path, users)
+tickets_log = CollectionLog(tickets_path, tickets)
+collection_logs = [
+    students_log,
+    journals_log,
+    assets_log,
+    announcements_log,
+    calendar_log,
+    departments_log,
+    users_log,
+    tickets_log,
+]
+for collection_log in collection_logs:
+    collection_log.replay()
+    atexit.register(collection_log.close)
+
+users_by_id = index_by(users)
+users_by_username = index_by(users, "username")
+tickets_by_id = index_by(tickets)
 site_settings.setdefault("widgets", DEFAULT_WIDGETS)
 site_settings.setdefault("onboarding_done", False)
 site_settings.setdefault("logo_file", None)
@@ -252,7 +631,7 @@ def persist_site_settings_defaults():
 persist_site_settings_defaults()
 
 
-def normalized_widgets():
+def normalize_stored_widgets():
     stored_widgets = site_settings.get("widgets") or []
     default_map = {w["id"]: w for w in DEFAULT_WIDGETS}
     normalized = []
@@ -266,28 +645,53 @@ def normalized_widgets():
         seen_ids.add(widget_id)
     for widget in DEFAULT_WIDGETS:
         if widget["id"] not in seen_ids:
-            normalized.append(widget)
-    site_settings["widgets"] = normalized
-    save_data(site_settings_path, site_settings)
-    return normalized
+            normalized.append(dict(widget))
+    if normalized != stored_widgets:
+        site_settings["widgets"] = normalized
+        save_data(site_settings_path, site_settings)
+
+
+normalize_stored_widgets()
+
+
+def normalized_widgets():
+    return site_settings["widgets"]
+
+
+_sorted_views = {}
+
+
+def sorted_view(name, collection, key, reverse=False):
+    version = collection_versions.get(id(collection), 0)
+    cached = _sorted_views.get(name)
+    if cached and cached[0] == version:
+        return cached[1]
+    result = sorted(collection, key=key, reverse=reverse)
+    _sorted_views[name] = (version, result)
+    return result
 
 
 def build_widget_cards():
+    return _compute_widget_cards(data_version)
+
+
+@lru_cache(maxsize=1)
+def _compute_widget_cards(version):
     widgets = normalized_widgets()
-    open_tickets = len([t for t in tickets if t.get("status") == "aberto"])
+    open_tickets = sum(1 for t in tickets if t.get("status") == "aberto")
     pending_queue = sum(
-        len([req for req in d.get("queue", []) if req.get("status") == "pendente"])
+        1
         for d in departments
+        for req in d.get("queue", [])
+        if req.get("status") == "pendente"
     )
     active_students = len(students)
-    next_event = None
-    if calendar_events:
-        try:
-            next_event = sorted(
-                calendar_events, key=lambda e: e.get("date") or "9999-12-31"
-            )[0]
-        except Exception:
-            next_event = None
+    try:
+        next_event = min(
+            calendar_events, key=lambda e: e.get("date") or "9999-12-31", default=None
+        )
+    except Exception:
+        next_event = None
 
     widget_cards = []
     for widget in widgets:
@@ -310,58 +714,7 @@ def build_widget_cards():
                 card["helper"] = "Adicione um evento no calendário"
         widget_cards.append(card)
     return [w for w in widget_cards if w.get("enabled")]
-roles = ensure_data_file(
-    roles_path,
-    [
-        {
-            "name": "Administrador",
-            "description": "Acesso total ao painel e configurações",
-            "permissions": [
-                "manage_students",
-                "manage_journals",
-                "manage_assets",
-                "manage_rules",
-                "manage_announcements",
-                "manage_calendar",
-                "manage_departments",
-                "approve_departments",
-                "manage_settings",
-                "manage_roles",
-                "manage_users",
-                "manage_tickets",
-            ],
-        },
-        {
-            "name": "Gerente",
-            "description": "Cuida de pessoas, calendários e arquivos",
-            "permissions": [
-                "manage_students",
-                "manage_assets",
-                "manage_calendar",
-                "manage_announcements",
-                "manage_departments",
-                "manage_tickets",
-            ],
-        },
-        {
-            "name": "Diretor de Departamento",
-            "description": "Aprova filas e acompanha entregas do time",
-            "permissions": [
-                "manage_assets",
-                "manage_calendar",
-                "approve_departments",
-                "manage_tickets",
-            ],
-        },
-        {
-            "name": "Colaborador",
-            "description": "Acesso apenas para consultar materiais",
-            "permissions": [],
-        },
-    ],
-)
-users = ensure_data_file(users_path, [])
-tickets = ensure_data_file(tickets_path, [])
+
 
 REASONS = [
     "Problema técnico",
@@ -371,48 +724,115 @@ REASONS = [
     "Outro",
 ]
 
-for asset in assets:
-    asset.setdefault("scope", "pessoal")
-    asset.setdefault("owner", "")
-    asset.setdefault("department_id", None)
-
-for student in students:
-    student.setdefault("department_id", None)
-    student.setdefault("user_id", None)
-    student.setdefault("status", "approved")
-    if student.get("status") != "approved":
-        student.setdefault("portal_enabled", False)
-
-for role in roles:
-    permissions = role.setdefault("permissions", [])
-    if role.get("name") in {"Administrador", "Gerente", "Diretor de Departamento"}:
-        if "manage_tickets" not in permissions:
-            permissions.append("manage_tickets")
-save_data(roles_path, roles)
-
-for user in users:
-    user.setdefault("status", "approved")
-    if user.get("status") != "approved":
-        user.setdefault("portal_enabled", False)
-save_data(users_path, users)
-save_data(students_path, students)
+def fill_defaults(record, defaults):
+    missing = defaults.keys() - record.keys()
+    for key in missing:
+        record[key] = defaults[key]
+    return bool(missing)
+
+
+def migrate_data():
+    changed = set()
+    for asset in assets:
+        if fill_defaults(asset, {"scope": "pessoal", "owner": "", "department_id": None}):
+            changed.add(assets_log)
+
+    for collection_log, defaults in (
+        (students_log, {"department_id": None, "user_id": None, "status": "approved"}),
+        (users_log, {"status": "approved"}),
+    ):
+        for record in collection_log.records:
+            if fill_defaults(record, defaults):
+                changed.add(collection_log)
+            if record.get("status") != "approved" and "portal_enabled" not in record:
+                record["portal_enabled"] = False
+                changed.add(collection_log)
+
+    for collection_log in (students_log, users_log, departments_log):
+        for record in collection_log.records:
+            if "sort_key" not in record:
+                set_sort_key(record)
+                changed.add(collection_log)
+
+    roles_changed = False
+    for role in roles:
+        if "sort_key" not in role:
+            set_sort_key(role)
+            roles_changed = True
+        if "permissions" not in role:
+            role["permissions"] = []
+            roles_changed = True
+        permissions = role["permissions"]
+        if role.get("name") in {"Administrador", "Gerente", "Diretor de Departamento"}:
+            if "manage_tickets" not in permissions:
+                permissions.append("manage_tickets")
+                roles_changed = True
+    if roles_changed:
+        save_data(roles_path, roles)
+
+    for collection_log in changed:
+        collection_log.compact()
+
+
+migrate_data()
 
 if not departments:
     departments.append(
         {
-            "id": str(uuid.uuid4()),
+            "id": new_id(),
             "name": "Redação",
             "description": "Produção de textos e pautas do jornal",
             "director": "Definir diretor",
-            "join_token": str(uuid.uuid4()),
+            "join_token": new_id(),
             "members": [],
             "queue": [],
         }
     )
-    save_data(departments_path, departments)
+    set_sort_key(departments[-1])
+    departments_log.upsert(departments[-1])
+
+for collection_log in collection_logs:
+    if collection_log.entries:
+        collection_log.compact()
+
+students_by_id = index_by(students)
+departments_by_id = index_by(departments)
+journals_by_id = index_by(journals)
+journals_by_approval = index_by(journals, "approval_token")
+departments_by_token = index_by(departments, "join_token")
+assets_by_id = index_by(assets)
+assets_by_hash = index_by(assets, "content_hash")
+queue_entries = {
+    (department.get("id"), entry.get("id")): entry
+    for department in departments
+    for entry in department.get("queue", [])
+}
+
+
+@app.teardown_request
+def flush_collection_logs(exc):
+    for collection_log in g.pop("dirty_logs", ()):
+        collection_log.flush()
+
+
+DASHBOARD_TABS = (
+    ("home", "Página Principal"),
+    ("students", "Funcionários"),
+    ("journals", "Jornais"),
+    ("assets", "Arquivos"),
+    ("rules", "Manual de Regras"),
+    ("announcements", "Administração"),
+    ("calendar", "Calendário"),
+    ("departments", "Departamentos"),
+    ("tickets", "Ajuda"),
+    ("settings", "Configuração"),
+    ("versions", "Versões"),
+)
+DASHBOARD_TABS_NO_STUDENTS = tuple(t for t in DASHBOARD_TABS if t[0] != "students")
 
 
 @app.context_processor
+@lru_cache(maxsize=1)
 def public_base_url():
     configured = config.get("public_base_url")
     if configured:
@@ -428,30 +848,15 @@ def public_base_url():
 
 @app.context_processor
 def inject_globals():
-    base_url = public_base_url().get("public_base_url")
+    base_url = public_base_url()["public_base_url"]
     user = current_user()
-    user_permissions = user.get("permissions", []) if user else []
-    tabs = [
-        ("home", "Página Principal"),
-        ("students", "Funcionários"),
-        ("journals", "Jornais"),
-        ("assets", "Arquivos"),
-        ("rules", "Manual de Regras"),
-        ("announcements", "Administração"),
-        ("calendar", "Calendário"),
-        ("departments", "Departamentos"),
-        ("tickets", "Ajuda"),
-        ("settings", "Configuração"),
-        ("versions", "Versões"),
-    ]
-    if "manage_students" not in user_permissions:
-        tabs = [t for t in tabs if t[0] != "students"]
+    user_permissions = session_permissions(user) if user else frozenset()
     return {
         "base_url": base_url,
-        "dashboard_tabs": tabs,
+        "dashboard_tabs": DASHBOARD_TABS if "manage_students" in user_permissions else DASHBOARD_TABS_NO_STUDENTS,
         "site_settings": site_settings,
         "roles": roles,
-        "current_user": current_user(),
+        "current_user": user,
     }
 
 
@@ -464,11 +869,30 @@ def permissions_for_role(role_name):
     return role.get("permissions", []) if role else []
 
 
+_all_permissions_cache = ()
+_role_permissions = {}
+
+
+def refresh_permissions_cache():
+    global _all_permissions_cache, _role_permissions
+    _all_permissions_cache = tuple(
+        sorted({perm for role in roles for perm in role.get("permissions", [])})
+    )
+    _role_permissions = {
+        role.get("name"): frozenset(role.get("permissions", [])) for role in roles
+    }
+
+
+def session_permissions(user):
+    cached = _role_permissions.get(user.get("role"))
+    return cached if cached else frozenset(user.get("permissions", ()))
+
+
 def all_permissions():
-    perm_set = set()
-    for role in roles:
-        perm_set.update(role.get("permissions", []))
-    return sorted(list(perm_set))
+    return _all_permissions_cache
+
+
+refresh_permissions_cache()
 
 
 def current_username():
@@ -482,6 +906,44 @@ def current_user():
     return session.get("user") or {}
 
 
+_failed_logins = {}
+
+
+def login_attempt_key(username):
+    # Per client and username: a shared school NAT must not lock every account.
+    return (request.remote_addr, username)
+
+
+def _failure_count(key, now):
+    entry = _failed_logins.get(key)
+    if not entry:
+        return 0
+    count, first_failure = entry
+    if now - first_failure > LOGIN_LOCKOUT_SECONDS:
+        _failed_logins.pop(key, None)
+        return 0
+    return count
+
+
+def login_locked(key):
+    now = time.monotonic()
+    client = key[0]
+    return (
+        _failure_count(key, now) >= LOGIN_MAX_ATTEMPTS
+        or _failure_count(client, now) >= LOGIN_MAX_CLIENT_ATTEMPTS
+    )
+
+
+def record_failed_login(key):
+    now = time.monotonic()
+    for tracked_key, (_, first) in list(_failed_logins.items()):
+        if now - first > LOGIN_LOCKOUT_SECONDS:
+            _failed_logins.pop(tracked_key, None)
+    for counted_key in (key, key[0]):
+        count, first_failure = _failed_logins.get(counted_key, (0, now))
+        _failed_logins[counted_key] = (count + 1, first_failure)
+
+
 @app.route("/")
 def index():
     if session.get("user"):
@@ -495,38 +957,52 @@ def login():
     if request.method == "POST":
         username = request.form.get("username")
         password = request.form.get("password")
+        attempt_key = login_attempt_key(username)
+        if login_locked(attempt_key):
+            flash("Muitas tentativas de login. Aguarde alguns minutos e tente novamente.", "danger")
+            return render_template("login.html", active_tab=active_tab)
+
+        admin = admins_by_username.get(username)
+        password_hash = admin.get("password_hash") if admin else None
+        if password_hash and check_password_hash(password_hash, password):
+            if needs_rehash(password_hash):
+                admin["password_hash"] = hash_password(password)
+                save_config(config)
+            admin_perms = permissions_for_role("Administrador") or list(all_permissions())
+            session["user"] = {
+                "username": username,
+                "role": "Administrador",
+                "permissions": admin_perms,
+            }
+            _failed_logins.pop(attempt_key, None)
+            flash("Login realizado com sucesso", "success")
+            return redirect(url_for("dashboard"))
 
-        for admin in config.get("admin_users", []):
-            password_hash = admin.get("password_hash")
-            if admin.get("username") == username and password_hash:
-                if check_password_hash(password_hash, password):
-                    admin_perms = permissions_for_role("Administrador") or all_permissions()
-                    session["user"] = {
-                        "username": username,
-                        "role": "Administrador",
-                        "permissions": admin_perms,
-                    }
-                    flash("Login realizado com sucesso", "success")
-                    return redirect(url_for("dashboard"))
-
-        for user in users:
-            if user.get("username") == username:
-                if user.get("status") != "approved":
-                    flash("Conta aguardando aprovação do administrador", "warning")
-                    return render_template("login.html", active_tab=active_tab)
-                if not user.get("portal_enabled", True):
-                    flash("Acesso ao portal bloqueado. Fale com um administrador.", "danger")
-                    return render_template("login.html", active_tab=active_tab)
-                if check_password_hash(user.get("password_hash", ""), password):
-                    perms = permissions_for_role(user.get("role"))
-                    session["user"] = {
-                        "username": username,
-                        "role": user.get("role"),
-                        "permissions": perms,
-                    }
-                    flash("Login realizado com sucesso", "success")
-                    return redirect(url_for("dashboard"))
+        user = find_user_by_username(username)
+        if not user and not password_hash:
+            check_password_hash(DUMMY_PASSWORD_HASH, password or "")
+        if user:
+            if user.get("status") != "approved":
+                flash("Conta aguardando aprovação do administrador", "warning")
+                return render_template("login.html", active_tab=active_tab)
+            if not user.get("portal_enabled", True):
+                flash("Acesso ao portal bloqueado. Fale com um administrador.", "danger")
+                return render_template("login.html", active_tab=active_tab)
+            if check_password_hash(user.get("password_hash", ""), password):
+                if needs_rehash(user["password_hash"]):
+                    user["password_hash"] = hash_password(password)
+                    users_log.upsert(user)
+                perms = permissions_for_role(user.get("role"))
+                session["user"] = {
+                    "username": username,
+                    "role": user.get("role"),
+                    "permissions": perms,
+                }
+                _failed_logins.pop(attempt_key, None)
+                flash("Login realizado com sucesso", "success")
+                return redirect(url_for("dashboard"))
 
+        record_failed_login(attempt_key)
         flash("Usuário ou senha inválidos ou acesso bloqueado", "danger")
 
     return render_template("login.html", active_tab=active_tab)
@@ -534,10 +1010,11 @@ def login():
 
 @app.route("/signup", methods=["POST"])
 def signup():
-    name = request.form.get("name")
-    username = request.form.get("username")
-    password = request.form.get("password")
-    contact = request.form.get("contact")
+    form = request.form
+    name = form.get("name")
+    username = form.get("username")
+    password = form.get("password")
+    contact = form.get("contact")
 
     if not all([name, username, password]):
         flash("Preencha nome, usuário e senha para solicitar acesso", "warning")
@@ -547,37 +1024,42 @@ def signup():
         flash("Usuário já existe ou está em aprovação", "danger")
         return redirect(url_for("login", tab="signup"))
 
-    student_id = str(uuid.uuid4())
+    student_id = new_id()
     student = {
         "id": student_id,
         "name": name,
+        "sort_key": name_sort_key(name),
         "role": "",
         "contact": contact,
         "notes": "Pedido vindo do portal",
         "portal_enabled": False,
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": request_now(),
         "photo": None,
         "department_id": None,
         "user_id": None,
         "status": "pending",
     }
     students.append(student)
+    students_by_id[student_id] = student
 
     user = {
-        "id": str(uuid.uuid4()),
+        "id": new_id(),
         "name": name,
+        "sort_key": name_sort_key(name),
         "username": username,
         "role": "Colaborador",
-        "password_hash": generate_password_hash(password),
+        "password_hash": hash_password(password),
         "portal_enabled": False,
         "linked_student_id": student_id,
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": request_now(),
         "status": "pending",
     }
     student["user_id"] = user["id"]
     users.append(user)
-    save_data(users_path, users)
-    save_data(students_path, students)
+    users_by_id[user["id"]] = user
+    users_by_username[username] = user
+    users_log.upsert(user)
+    students_log.upsert(student)
 
     flash("Cadastro enviado para aprovação. Aguarde a liberação do administrador.", "info")
     return redirect(url_for("login"))
@@ -595,9 +1077,9 @@ def logout():
 @login_required
 @require_permission("manage_settings")
 def welcome():
-    sorted_departments = sorted(departments, key=lambda d: d.get("name", "").lower())
-    sorted_users = sorted(users, key=lambda u: u.get("name", "").lower())
-    sorted_roles = sorted(roles, key=lambda r: r.get("name", "").lower())
+    sorted_departments = sorted_view("departments", departments, key=itemgetter("sort_key"))
+    sorted_users = sorted_view("users", users, key=itemgetter("sort_key"))
+    sorted_roles = sorted_view("roles", roles, key=itemgetter("sort_key"))
     return render_template(
         "welcome.html",
         departments=sorted_departments,
@@ -627,31 +1109,30 @@ def dashboard():
         return redirect(url_for("welcome"))
 
     tab = request.args.get("tab", "home")
-    sorted_students = sorted(students, key=lambda s: s.get("name", "").lower())
+    sorted_students = sorted_view("students", students, key=itemgetter("sort_key"))
     pending_students = [s for s in sorted_students if s.get("status") != "approved"]
     approved_students = [s for s in sorted_students if s.get("status") == "approved"]
-    sorted_journals = sorted(
-        journals, key=lambda j: j.get("release_date", ""), reverse=True
+    sorted_journals = sorted_view(
+        "journals", journals, key=lambda j: j.get("release_date", ""), reverse=True
     )
-    sorted_assets = sorted(assets, key=lambda a: a.get("uploaded_at", ""), reverse=True)
-    sorted_announcements = sorted(
-        announcements, key=lambda a: a.get("created_at", ""), reverse=True
+    sorted_assets = sorted_view(
+        "assets", assets, key=lambda a: a.get("uploaded_at", ""), reverse=True
     )
-    sorted_events = sorted(calendar_events, key=lambda e: e.get("date", ""))
-    sorted_departments = sorted(departments, key=lambda d: d.get("name", "").lower())
-    sorted_users = sorted(users, key=lambda u: u.get("name", "").lower())
-    sorted_roles = sorted(roles, key=lambda r: r.get("name", "").lower())
+    sorted_announcements = sorted_view(
+        "announcements", announcements, key=lambda a: a.get("created_at", ""), reverse=True
+    )
+    sorted_events = sorted_view("calendar", calendar_events, key=lambda e: e.get("date", ""))
+    sorted_departments = sorted_view("departments", departments, key=itemgetter("sort_key"))
+    sorted_users = sorted_view("users", users, key=itemgetter("sort_key"))
+    sorted_roles = sorted_view("roles", roles, key=itemgetter("sort_key"))
     user = current_user()
-    if "manage_tickets" in user.get("permissions", []):
-        visible_tickets = sorted(
-            tickets, key=lambda t: t.get("created_at", ""), reverse=True
-        )
+    sorted_tickets = sorted_view(
+        "tickets", tickets, key=lambda t: t.get("created_at", ""), reverse=True
+    )
+    if "manage_tickets" in session_permissions(user):
+        visible_tickets = sorted_tickets
     else:
-        visible_tickets = sorted(
-            [t for t in tickets if t.get("created_by") == current_username()],
-            key=lambda t: t.get("created_at", ""),
-            reverse=True,
-        )
+        visible_tickets = [t for t in sorted_tickets if t.get("created_by") == current_username()]
     widget_cards = build_widget_cards()
     widget_config = normalized_widgets()
     journal_dates = [
@@ -667,7 +1148,7 @@ def dashboard():
             for i in range(1, len(journal_dates))
         ]
         cadence_days = round(sum(gaps) / len(gaps), 1)
-    return render_template(
+    response = make_response(render_template(
         "dashboard.html",
         current_tab=tab,
         students=sorted_students,
@@ -687,65 +1168,69 @@ def dashboard():
         widget_cards=widget_cards,
         widget_config=widget_config,
         cadence_days=cadence_days,
-    )
+    ))
+    response.set_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest())
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
 
 
 @app.route("/students", methods=["POST"])
 @login_required
 @require_permission("manage_students")
 def create_student():
+    form = request.form
     photo = request.files.get("photo")
     photo_filename = None
     if photo and photo.filename:
         if not allowed_file(photo.filename, ALLOWED_IMAGE_EXTENSIONS):
             flash("Envie uma imagem válida para a foto do funcionário", "danger")
             return redirect(url_for("dashboard", tab="students"))
-        photo_filename = f"{uuid.uuid4()}_{secure_filename(photo.filename)}"
+        photo_filename = f"{new_id()}_{secure_filename(photo.filename)}"
         photo_destination = os.path.join(app.config["UPLOAD_FOLDER_PHOTOS"], photo_filename)
-        photo.save(photo_destination)
+        save_upload(photo, photo_destination)
     student = {
-        "id": str(uuid.uuid4()),
-        "name": request.form.get("name"),
-        "role": request.form.get("role"),
-        "contact": request.form.get("contact"),
-        "notes": request.form.get("notes"),
+        "id": new_id(),
+        "name": form.get("name"),
+        "role": form.get("role"),
+        "contact": form.get("contact"),
+        "notes": form.get("notes"),
         "status": "approved",
-        "portal_enabled": request.form.get("portal_enabled") == "on",
-        "created_at": datetime.utcnow().isoformat(),
+        "portal_enabled": form.get("portal_enabled") == "on",
+        "created_at": request_now(),
         "photo": photo_filename,
-        "department_id": request.form.get("department_id") or None,
+        "department_id": form.get("department_id") or None,
         "user_id": None,
     }
+    set_sort_key(student)
     if student.get("department_id"):
-        department = next(
-            (d for d in departments if d.get("id") == student.get("department_id")), None
-        )
+        department = departments_by_id.get(student.get("department_id"))
         if department:
             department.setdefault("members", []).append(
                 {
                     "name": student.get("name"),
                     "role": student.get("role"),
-                    "joined_at": datetime.utcnow().isoformat(),
+                    "joined_at": request_now(),
                 }
             )
-            save_data(departments_path, departments)
+            departments_log.upsert(department)
 
     students.append(student)
-    save_data(students_path, students)
+    students_by_id[student["id"]] = student
+    students_log.upsert(student)
 
     if student.get("portal_enabled"):
-        username = request.form.get("portal_username")
-        password = request.form.get("portal_password")
-        role_name = request.form.get("portal_role") or "Colaborador"
+        username = form.get("portal_username")
+        password = form.get("portal_password")
+        role_name = form.get("portal_role") or "Colaborador"
         try:
             link_portal_user(student, username, password, role_name, enabled=True)
         except ValueError as err:
             flash(str(err), "danger")
             return redirect(url_for("dashboard", tab="students"))
-        save_data(students_path, students)
+        students_log.upsert(student)
 
     flash("Ficha de participante criada", "success")
-    destination = request.form.get("redirect_to") or url_for("dashboard", tab="students")
+    destination = form.get("redirect_to") or url_for("dashboard", tab="students")
     return redirect(destination)
 
 
@@ -753,27 +1238,27 @@ def create_student():
 @login_required
 @require_permission("manage_students")
 def toggle_student(student_id):
-    for student in students:
-        if student.get("id") == student_id:
-            desired = not student.get("portal_enabled", False)
-            if student.get("status") != "approved" and desired:
-                flash("Aprove o cadastro antes de liberar o portal.", "warning")
-                break
-            if desired and not student.get("user_id"):
-                flash(
-                    "Configure usuário e senha antes de liberar o portal.",
-                    "danger",
-                )
-                break
-            student["portal_enabled"] = desired
-            if student.get("user_id"):
-                user = next((u for u in users if u.get("id") == student.get("user_id")), None)
-                if user:
-                    user["portal_enabled"] = desired
-                    save_data(users_path, users)
-            save_data(students_path, students)
-            flash("Permissão de portal atualizada", "info")
-            break
+    student = students_by_id.get(student_id)
+    if not student:
+        return redirect(url_for("dashboard", tab="students"))
+    desired = not student.get("portal_enabled", False)
+    if student.get("status") != "approved" and desired:
+        flash("Aprove o cadastro antes de liberar o portal.", "warning")
+        return redirect(url_for("dashboard", tab="students"))
+    if desired and not student.get("user_id"):
+        flash(
+            "Configure usuário e senha antes de liberar o portal.",
+            "danger",
+        )
+        return redirect(url_for("dashboard", tab="students"))
+    student["portal_enabled"] = desired
+    if student.get("user_id"):
+        user = users_by_id.get(student.get("user_id"))
+        if user:
+            user["portal_enabled"] = desired
+            users_log.upsert(user)
+    students_log.upsert(student)
+    flash("Permissão de portal atualizada", "info")
     return redirect(url_for("dashboard", tab="students"))
 
 
@@ -781,22 +1266,23 @@ def toggle_student(student_id):
 @login_required
 @require_permission("manage_students")
 def delete_student(student_id):
-    global students
-    student = next((s for s in students if s.get("id") == student_id), None)
+    student = students_by_id.pop(student_id, None)
     if student and student.get("user_id"):
-        linked_user = next((u for u in users if u.get("id") == student.get("user_id")), None)
+        linked_user = users_by_id.pop(student.get("user_id"), None)
         if linked_user:
             users.remove(linked_user)
-            save_data(users_path, users)
+            users_by_username.pop(linked_user.get("username"), None)
+            users_log.delete(linked_user["id"])
     if student and student.get("department_id"):
-        department = next((d for d in departments if d.get("id") == student.get("department_id")), None)
+        department = departments_by_id.get(student.get("department_id"))
         if department:
             department["members"] = [
                 m for m in department.get("members", []) if m.get("name") != student.get("name")
             ]
-            save_data(departments_path, departments)
-    students = [s for s in students if s.get("id") != student_id]
-    save_data(students_path, students)
+            departments_log.upsert(department)
+    if student:
+        students.remove(student)
+        students_log.delete(student_id)
     flash("Funcionário removido", "info")
     return redirect(url_for("dashboard", tab="students"))
 
@@ -805,56 +1291,50 @@ def delete_student(student_id):
 @login_required
 @require_permission("manage_students")
 def update_student(student_id):
-    student = next((s for s in students if s.get("id") == student_id), None)
+    form = request.form
+    student = students_by_id.get(student_id)
     if not student:
         flash("Funcionário não encontrado", "danger")
         return redirect(url_for("dashboard", tab="students"))
 
     previous_department = student.get("department_id")
-    requested_status = request.form.get("status") or student.get("status", "approved")
+    requested_status = form.get("status") or student.get("status", "approved")
     allowed_status = {"approved", "pending", "rejected"}
     if requested_status not in allowed_status:
         requested_status = student.get("status", "approved")
     student["status"] = requested_status
-    student["name"] = request.form.get("name") or student.get("name")
-    student["role"] = request.form.get("role")
-    student["contact"] = request.form.get("contact")
-    student["notes"] = request.form.get("notes")
-    student["department_id"] = request.form.get("department_id") or None
+    student["name"] = form.get("name") or student.get("name")
+    set_sort_key(student)
+    student["role"] = form.get("role")
+    student["contact"] = form.get("contact")
+    student["notes"] = form.get("notes")
+    student["department_id"] = form.get("department_id") or None
 
     if previous_department != student.get("department_id"):
         if previous_department:
-            old_department = next(
-                (d for d in departments if d.get("id") == previous_department), None
-            )
+            old_department = departments_by_id.get(previous_department)
             if old_department:
                 old_department["members"] = [
                     m for m in old_department.get("members", []) if m.get("name") != student.get("name")
                 ]
-                save_data(departments_path, departments)
+                departments_log.upsert(old_department)
         if student.get("department_id"):
-            new_dep = next(
-                (d for d in departments if d.get("id") == student.get("department_id")), None
-            )
+            new_dep = departments_by_id.get(student.get("department_id"))
             if new_dep:
                 new_dep.setdefault("members", []).append(
                     {
                         "name": student.get("name"),
                         "role": student.get("role"),
-                        "joined_at": datetime.utcnow().isoformat(),
+                        "joined_at": request_now(),
                     }
                 )
-                save_data(departments_path, departments)
+                departments_log.upsert(new_dep)
 
-    desired_portal = request.form.get("portal_enabled") == "on" and requested_status == "approved"
-    existing_user = (
-        next((u for u in users if u.get("id") == student.get("user_id")), None)
-        if student.get("user_id")
-        else None
-    )
-    username = request.form.get("portal_username") or (existing_user.get("username") if existing_user else None)
-    password = request.form.get("portal_password") or None
-    role_name = request.form.get("portal_role") or (existing_user.get("role") if existing_user else "Colaborador")
+    desired_portal = form.get("portal_enabled") == "on" and requested_status == "approved"
+    existing_user = users_by_id.get(student.get("user_id"))
+    username = form.get("portal_username") or (existing_user.get("username") if existing_user else None)
+    password = form.get("portal_password") or None
+    role_name = form.get("portal_role") or (existing_user.get("role") if existing_user else "Colaborador")
 
     if username or password or existing_user or desired_portal:
         try:
@@ -870,14 +1350,14 @@ def update_student(student_id):
             return redirect(url_for("dashboard", tab="students"))
     student["portal_enabled"] = desired_portal if requested_status == "approved" else False
     if student.get("user_id"):
-        user = next((u for u in users if u.get("id") == student.get("user_id")), None)
+        user = users_by_id.get(student.get("user_id"))
         if user:
             user["status"] = requested_status
             if requested_status != "approved":
                 user["portal_enabled"] = False
-            save_data(users_path, users)
+            users_log.upsert(user)
 
-    save_data(students_path, students)
+    students_log.upsert(student)
     flash("Ficha atualizada", "success")
     return redirect(url_for("dashboard", tab="students"))
 
@@ -886,13 +1366,11 @@ def update_student(student_id):
 @login_required
 @require_permission("manage_students")
 def print_student(student_id):
-    student = next((s for s in students if s.get("id") == student_id), None)
+    student = students_by_id.get(student_id)
     if not student:
         flash("Funcionário não encontrado", "danger")
         return redirect(url_for("dashboard", tab="students"))
-    department = next(
-        (d for d in departments if d.get("id") == student.get("department_id")), None
-    )
+    department = departments_by_id.get(student.get("department_id"))
     return render_template("print_student.html", student=student, department=department)
 
 
@@ -904,7 +1382,7 @@ def print_all_students():
     for s in students:
         if s.get("status") != "approved":
             continue
-        dept = next((d for d in departments if d.get("id") == s.get("department_id")), None)
+        dept = departments_by_id.get(s.get("department_id"))
         enriched.append({"data": s, "department": dept})
     return render_template("print_all_students.html", students=enriched)
 
@@ -913,30 +1391,33 @@ def print_all_students():
 @login_required
 @require_permission("manage_journals")
 def create_journal():
+    form = request.form
     file = request.files.get("file")
     filename = None
     if file and file.filename:
         if not allowed_file(file.filename, ALLOWED_JOURNAL_EXTENSIONS):
             flash("Formato não permitido. Envie apenas PDF.", "danger")
             return redirect(url_for("dashboard", tab="journals"))
-        filename = f"{uuid.uuid4()}_{secure_filename(file.filename)}"
+        filename = f"{new_id()}_{secure_filename(file.filename)}"
         destination = os.path.join(app.config["UPLOAD_FOLDER_JOURNALS"], filename)
-        file.save(destination)
+        save_upload(file, destination)
 
     journal = {
-        "id": str(uuid.uuid4()),
-        "title": request.form.get("title"),
-        "edition": request.form.get("edition"),
-        "release_date": request.form.get("release_date"),
-        "description": request.form.get("description"),
+        "id": new_id(),
+        "title": form.get("title"),
+        "edition": form.get("edition"),
+        "release_date": form.get("release_date"),
+        "description": form.get("description"),
         "file": filename,
         "status": "pendente",
         "approval_reason": None,
-        "approval_token": str(uuid.uuid4()),
-        "created_at": datetime.utcnow().isoformat(),
+        "approval_token": new_id(),
+        "created_at": request_now(),
     }
     journals.append(journal)
-    save_data(journals_path, journals)
+    journals_by_id[journal["id"]] = journal
+    journals_by_approval[journal["approval_token"]] = journal
+    journals_log.upsert(journal)
     flash("Jornal enviado para aprovação", "success")
     return redirect(url_for("dashboard", tab="journals"))
 
@@ -945,9 +1426,11 @@ def create_journal():
 @login_required
 @require_permission("manage_journals")
 def delete_journal(journal_id):
-    global journals
-    journals = [j for j in journals if j.get("id") != journal_id]
-    save_data(journals_path, journals)
+    journal = journals_by_id.pop(journal_id, None)
+    if journal:
+        journals.remove(journal)
+        journals_by_approval.pop(journal.get("approval_token"), None)
+        journals_log.delete(journal_id)
     flash("Jornal removido", "info")
     return redirect(url_for("dashboard", tab="journals"))
 
@@ -956,6 +1439,7 @@ def delete_journal(journal_id):
 @login_required
 @require_permission("manage_assets")
 def upload_asset():
+    form = request.form
     file = request.files.get("file")
     if not file or not file.filename:
         flash("Selecione um arquivo para enviar", "warning")
@@ -965,24 +1449,37 @@ def upload_asset():
         flash("Formato de arquivo não permitido", "danger")
         return redirect(url_for("dashboard", tab="assets"))
 
-    filename = f"{uuid.uuid4()}_{secure_filename(file.filename)}"
+    filename = f"{new_id()}_{secure_filename(file.filename)}"
     destination = os.path.join(app.config["UPLOAD_FOLDER_ASSETS"], filename)
-    file.save(destination)
+    content_hash = save_upload(file, destination)
+    duplicate = assets_by_hash.get(content_hash)
+    if duplicate:
+        existing = os.path.join(app.config["UPLOAD_FOLDER_ASSETS"], duplicate["stored_name"])
+        linked = f"{destination}.link"
+        try:
+            os.link(existing, linked)
+            os.replace(linked, destination)
+        except OSError:
+            if os.path.lexists(linked):
+                os.remove(linked)
 
     asset = {
-        "id": str(uuid.uuid4()),
+        "id": new_id(),
         "original_name": file.filename,
         "stored_name": filename,
-        "notes": request.form.get("notes"),
-        "owner": request.form.get("owner") or current_username(),
-        "department_id": request.form.get("department_id") or None,
-        "scope": "departamento" if request.form.get("department_id") else "pessoal",
-        "uploaded_at": datetime.utcnow().isoformat(),
+        "content_hash": content_hash,
+        "notes": form.get("notes"),
+        "owner": form.get("owner") or current_username(),
+        "department_id": form.get("department_id") or None,
+        "scope": "departamento" if form.get("department_id") else "pessoal",
+        "uploaded_at": request_now(),
     }
     assets.append(asset)
-    save_data(assets_path, assets)
+    assets_by_id[asset["id"]] = asset
+    assets_by_hash[content_hash] = asset
+    assets_log.upsert(asset)
     flash("Arquivo arquivado com sucesso", "success")
-    destination = request.form.get("redirect_to") or url_for("dashboard", tab="assets")
+    destination = form.get("redirect_to") or url_for("dashboard", tab="assets")
     return redirect(destination)
 
 
@@ -990,9 +1487,17 @@ def upload_asset():
 @login_required
 @require_permission("manage_assets")
 def delete_asset(asset_id):
-    global assets
-    assets = [a for a in assets if a.get("id") != asset_id]
-    save_data(assets_path, assets)
+    asset = assets_by_id.pop(asset_id, None)
+    if asset:
+        assets.remove(asset)
+        content_hash = asset.get("content_hash")
+        if content_hash and assets_by_hash.get(content_hash) is asset:
+            survivor = next((a for a in reversed(assets) if a.get("content_hash") == content_hash), None)
+            if survivor:
+                assets_by_hash[content_hash] = survivor
+            else:
+                del assets_by_hash[content_hash]
+        assets_log.delete(asset_id)
     flash("Arquivo removido", "info")
     return redirect(url_for("dashboard", tab="assets"))
 
@@ -1000,25 +1505,25 @@ def delete_asset(asset_id):
 @app.route("/uploads/journals/<filename>")
 @login_required
 def download_journal(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER_JOURNALS"], filename)
+    return send_upload(app.config["UPLOAD_FOLDER_JOURNALS"], filename)
 
 
 @app.route("/uploads/assets/<filename>")
 @login_required
 def download_asset(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER_ASSETS"], filename)
+    return send_upload(app.config["UPLOAD_FOLDER_ASSETS"], filename)
 
 
 @app.route("/uploads/logos/<filename>")
 @login_required
 def logo_file(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER_LOGOS"], filename)
+    return send_upload(app.config["UPLOAD_FOLDER_LOGOS"], filename)
 
 
 @app.route("/uploads/photos/<filename>")
 @login_required
 def employee_photo(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER_PHOTOS"], filename)
+    return send_upload(app.config["UPLOAD_FOLDER_PHOTOS"], filename)
 
 
 @app.route("/rules", methods=["POST"])
@@ -1026,7 +1531,7 @@ def employee_photo(filename):
 @require_permission("manage_rules")
 def update_rules():
     rules["content"] = request.form.get("content", "")
-    rules["updated_at"] = datetime.utcnow().isoformat()
+    rules["updated_at"] = request_now()
     save_data(rules_path, rules)
     flash("Manual de regras atualizado", "success")
     return redirect(url_for("dashboard", tab="rules"))
@@ -1036,18 +1541,19 @@ def update_rules():
 @login_required
 @require_permission("manage_announcements")
 def create_announcement():
+    form = request.form
     announcement = {
-        "id": str(uuid.uuid4()),
-        "title": request.form.get("title"),
-        "body": request.form.get("body"),
-        "audience": request.form.get("audience", "todos"),
-        "pinned": request.form.get("pinned") == "on",
-        "created_at": datetime.utcnow().isoformat(),
+        "id": new_id(),
+        "title": form.get("title"),
+        "body": form.get("body"),
+        "audience": form.get("audience", "todos"),
+        "pinned": form.get("pinned") == "on",
+        "created_at": request_now(),
     }
     announcements.append(announcement)
-    save_data(announcements_path, announcements)
+    announcements_log.upsert(announcement)
     flash("Mensagem publicada", "success")
-    destination = request.form.get("redirect_to") or url_for("dashboard", tab="announcements")
+    destination = form.get("redirect_to") or url_for("dashboard", tab="announcements")
     return redirect(destination)
 
 
@@ -1055,9 +1561,8 @@ def create_announcement():
 @login_required
 @require_permission("manage_announcements")
 def remove_announcement(announcement_id):
-    global announcements
-    announcements = [a for a in announcements if a.get("id") != announcement_id]
-    save_data(announcements_path, announcements)
+    announcements[:] = [a for a in announcements if a.get("id") != announcement_id]
+    announcements_log.delete(announcement_id)
     flash("Mensagem removida", "info")
     return redirect(url_for("dashboard", tab="announcements"))
 
@@ -1066,18 +1571,19 @@ def remove_announcement(announcement_id):
 @login_required
 @require_permission("manage_calendar")
 def add_calendar_event():
+    form = request.form
     event = {
-        "id": str(uuid.uuid4()),
-        "title": request.form.get("title"),
-        "date": request.form.get("date"),
-        "category": request.form.get("category", "geral"),
-        "department_id": request.form.get("department_id") or None,
-        "description": request.form.get("description"),
+        "id": new_id(),
+        "title": form.get("title"),
+        "date": form.get("date"),
+        "category": form.get("category", "geral"),
+        "department_id": form.get("department_id") or None,
+        "description": form.get("description"),
     }
     calendar_events.append(event)
-    save_data(calendar_path, calendar_events)
+    calendar_log.upsert(event)
     flash("Evento adicionado", "success")
-    destination = request.form.get("redirect_to") or url_for("dashboard", tab="calendar")
+    destination = form.get("redirect_to") or url_for("dashboard", tab="calendar")
     return redirect(destination)
 
 
@@ -1085,9 +1591,8 @@ def add_calendar_event():
 @login_required
 @require_permission("manage_calendar")
 def delete_calendar_event(event_id):
-    global calendar_events
-    calendar_events = [e for e in calendar_events if e.get("id") != event_id]
-    save_data(calendar_path, calendar_events)
+    calendar_events[:] = [e for e in calendar_events if e.get("id") != event_id]
+    calendar_log.delete(event_id)
     flash("Evento removido", "info")
     return redirect(url_for("dashboard", tab="calendar"))
 
@@ -1095,13 +1600,14 @@ def delete_calendar_event(event_id):
 @app.route("/tickets", methods=["POST"])
 @login_required
 def create_ticket():
-    reason = request.form.get("reason") or "Outro"
-    custom_reason = request.form.get("custom_reason")
+    form = request.form
+    reason = form.get("reason") or "Outro"
+    custom_reason = form.get("custom_reason")
     ticket = {
-        "id": str(uuid.uuid4()),
-        "title": request.form.get("title"),
+        "id": new_id(),
+        "title": form.get("title"),
         "reason": custom_reason if reason == "Outro" else reason,
-        "urgency": request.form.get("urgency", "normal"),
+        "urgency": form.get("urgency", "normal"),
         "status": "aberto",
         "created_by": current_username(),
         "created_role": current_user().get("role"),
@@ -1109,14 +1615,15 @@ def create_ticket():
             {
                 "author": current_username(),
                 "role": current_user().get("role"),
-                "body": request.form.get("message"),
-                "timestamp": datetime.utcnow().isoformat(),
+                "body": form.get("message"),
+                "timestamp": request_now(),
             }
         ],
-        "created_at": datetime.utcnow().isoformat(),
+        "created_at": request_now(),
     }
     tickets.append(ticket)
-    save_data(tickets_path, tickets)
+    tickets_by_id[ticket["id"]] = ticket
+    tickets_log.upsert(ticket)
     flash("Ticket criado e enviado para a diretoria", "success")
     return redirect(url_for("dashboard", tab="tickets"))
 
@@ -1124,13 +1631,13 @@ def create_ticket():
 @app.route("/tickets/<ticket_id>/reply", methods=["POST"])
 @login_required
 def reply_ticket(ticket_id):
-    ticket = next((t for t in tickets if t.get("id") == ticket_id), None)
+    ticket = tickets_by_id.get(ticket_id)
     if not ticket:
         flash("Ticket não encontrado", "danger")
         return redirect(url_for("dashboard", tab="tickets"))
 
     user = current_user()
-    permissions = user.get("permissions", [])
+    permissions = session_permissions(user)
     if ticket.get("created_by") != current_username() and "manage_tickets" not in permissions:
         flash("Você não pode interagir com este ticket", "danger")
         return redirect(url_for("dashboard", tab="tickets"))
@@ -1140,12 +1647,12 @@ def reply_ticket(ticket_id):
             "author": current_username(),
             "role": user.get("role"),
             "body": request.form.get("message"),
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": request_now(),
         }
     )
     if ticket.get("status") == "fechado" and "manage_tickets" in permissions:
         ticket["status"] = "aberto"
-    save_data(tickets_path, tickets)
+    tickets_log.upsert(ticket)
     flash("Resposta enviada", "success")
     return redirect(url_for("dashboard", tab="tickets"))
 
@@ -1154,7 +1661,7 @@ def reply_ticket(ticket_id):
 @login_required
 @require_permission("manage_tickets")
 def close_ticket(ticket_id):
-    ticket = next((t for t in tickets if t.get("id") == ticket_id), None)
+    ticket = tickets_by_id.get(ticket_id)
     if not ticket:
         flash("Ticket não encontrado", "danger")
         return redirect(url_for("dashboard", tab="tickets"))
@@ -1164,10 +1671,10 @@ def close_ticket(ticket_id):
             "author": current_username(),
             "role": current_user().get("role"),
             "body": request.form.get("message") or "Ticket fechado",
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": request_now(),
         }
     )
-    save_data(tickets_path, tickets)
+    tickets_log.upsert(ticket)
     flash("Ticket encerrado", "info")
     return redirect(url_for("dashboard", tab="tickets"))
 
@@ -1176,9 +1683,10 @@ def close_ticket(ticket_id):
 @login_required
 @require_permission("manage_tickets")
 def delete_ticket(ticket_id):
-    global tickets
-    tickets = [t for t in tickets if t.get("id") != ticket_id]
-    save_data(tickets_path, tickets)
+    ticket = tickets_by_id.pop(ticket_id, None)
+    if ticket:
+        tickets.remove(ticket)
+        tickets_log.delete(ticket_id)
     flash("Ticket removido", "info")
     return redirect(url_for("dashboard", tab="tickets"))
 
@@ -1187,19 +1695,23 @@ def delete_ticket(ticket_id):
 @login_required
 @require_permission("manage_departments")
 def create_department():
+    form = request.form
     department = {
-        "id": str(uuid.uuid4()),
-        "name": request.form.get("name"),
-        "description": request.form.get("description"),
-        "director": request.form.get("director"),
-        "join_token": str(uuid.uuid4()),
+        "id": new_id(),
+        "name": form.get("name"),
+        "description": form.get("description"),
+        "director": form.get("director"),
+        "join_token": new_id(),
         "members": [],
         "queue": [],
     }
+    set_sort_key(department)
     departments.append(department)
-    save_data(departments_path, departments)
+    departments_by_id[department["id"]] = department
+    departments_by_token[department["join_token"]] = department
+    departments_log.upsert(department)
     flash("Departamento criado", "success")
-    destination = request.form.get("redirect_to") or url_for("dashboard", tab="departments")
+    destination = form.get("redirect_to") or url_for("dashboard", tab="departments")
     return redirect(destination)
 
 
@@ -1207,31 +1719,34 @@ def create_department():
 @login_required
 @require_permission("approve_departments")
 def decide_queue(department_id, queue_id, action):
-    department = next((d for d in departments if d.get("id") == department_id), None)
+    department = departments_by_id.get(department_id)
     if not department:
         flash("Departamento não encontrado", "danger")
         return redirect(url_for("dashboard", tab="departments"))
 
-    for request_entry in department.get("queue", []):
-        if request_entry.get("id") == queue_id and request_entry.get("status") == "pendente":
-            if action == "approve":
-                request_entry["status"] = "aprovado"
-                request_entry["decided_at"] = datetime.utcnow().isoformat()
-                request_entry["decided_by"] = current_username()
-                department.setdefault("members", []).append(
-                    {
-                        "name": request_entry.get("name"),
-                        "role": request_entry.get("desired_role"),
-                        "joined_at": datetime.utcnow().isoformat(),
-                    }
-                )
-            elif action == "reject":
-                request_entry["status"] = "rejeitado"
-                request_entry["decided_at"] = datetime.utcnow().isoformat()
-                request_entry["decided_by"] = current_username()
-            break
+    if action not in {"approve", "reject"}:
+        flash("Ação inválida", "danger")
+        return redirect(url_for("dashboard", tab="departments"))
+
+    request_entry = queue_entries.get((department_id, queue_id))
+    if request_entry and request_entry.get("status") == "pendente":
+        if action == "approve":
+            request_entry["status"] = "aprovado"
+            request_entry["decided_at"] = request_now()
+            request_entry["decided_by"] = current_username()
+            department.setdefault("members", []).append(
+                {
+                    "name": request_entry.get("name"),
+                    "role": request_entry.get("desired_role"),
+                    "joined_at": request_now(),
+                }
+            )
+        else:
+            request_entry["status"] = "rejeitado"
+            request_entry["decided_at"] = request_now()
+            request_entry["decided_by"] = current_username()
+        departments_log.upsert(department)
 
-    save_data(departments_path, departments)
     flash("Fila atualizada", "info")
     return redirect(url_for("dashboard", tab="departments"))
 
@@ -1240,7 +1755,7 @@ def decide_queue(department_id, queue_id, action):
 @login_required
 @require_permission("manage_departments")
 def add_member(department_id):
-    department = next((d for d in departments if d.get("id") == department_id), None)
+    department = departments_by_id.get(department_id)
     if not department:
         flash("Departamento não encontrado", "danger")
         return redirect(url_for("dashboard", tab="departments"))
@@ -1249,10 +1764,10 @@ def add_member(department_id):
         {
             "name": request.form.get("name"),
             "role": request.form.get("role"),
-            "joined_at": datetime.utcnow().isoformat(),
+            "joined_at": request_now(),
         }
     )
-    save_data(departments_path, departments)
+    departments_log.upsert(department)
     flash("Membro adicionado", "success")
     return redirect(url_for("dashboard", tab="departments"))
 
@@ -1261,19 +1776,22 @@ def add_member(department_id):
 @login_required
 @require_permission("manage_roles")
 def create_role():
+    form = request.form
     role = {
-        "name": request.form.get("name"),
-        "description": request.form.get("description"),
-        "permissions": request.form.getlist("permissions"),
+        "name": form.get("name"),
+        "description": form.get("description"),
+        "permissions": form.getlist("permissions"),
     }
     existing = find_role(role.get("name"))
     if existing:
         flash("Já existe um cargo com esse nome", "warning")
         return redirect(url_for("dashboard", tab="settings"))
+    set_sort_key(role)
     roles.append(role)
+    refresh_permissions_cache()
     save_data(roles_path, roles)
     flash("Cargo criado", "success")
-    destination = request.form.get("redirect_to") or url_for("dashboard", tab="settings")
+    destination = form.get("redirect_to") or url_for("dashboard", tab="settings")
     return redirect(destination)
 
 
@@ -1281,24 +1799,29 @@ def create_role():
 @login_required
 @require_permission("manage_users")
 def create_user():
-    username = request.form.get("username")
-    if any(u.get("username") == username for u in users):
+    form = request.form
+    username = form.get("username")
+    if find_user_by_username(username):
         flash("Usuário já existe", "warning")
         return redirect(url_for("dashboard", tab="settings"))
-    password = request.form.get("password")
+    password = form.get("password")
     user = {
-        "id": str(uuid.uuid4()),
-        "name": request.form.get("name"),
+        "id": new_id(),
+        "name": form.get("name"),
         "username": username,
-        "role": request.form.get("role"),
-        "password_hash": generate_password_hash(password),
-        "portal_enabled": request.form.get("portal_enabled") == "on",
-        "created_at": datetime.utcnow().isoformat(),
+        "role": form.get("role"),
+        "password_hash": hash_password(password),
+        "portal_enabled": form.get("portal_enabled") == "on",
+        "status": "approved",
+        "created_at": request_now(),
     }
+    set_sort_key(user)
     users.append(user)
-    save_data(users_path, users)
+    users_by_id[user["id"]] = user
+    users_by_username[username] = user
+    users_log.upsert(user)
     flash("Usuário criado com sucesso", "success")
-    destination = request.form.get("redirect_to") or url_for("dashboard", tab="settings")
+    destination = form.get("redirect_to") or url_for("dashboard", tab="settings")
     return redirect(destination)
 
 
@@ -1307,7 +1830,7 @@ def create_user():
 @require_permission("manage_roles")
 def update_user_role(user_id):
     target_role = request.form.get("role")
-    user = next((u for u in users if u.get("id") == user_id), None)
+    user = users_by_id.get(user_id)
     if not user:
         flash("Usuário não encontrado", "danger")
         return redirect(url_for("dashboard", tab="settings"))
@@ -1315,7 +1838,7 @@ def update_user_role(user_id):
         flash("Cargo inválido", "danger")
         return redirect(url_for("dashboard", tab="settings"))
     user["role"] = target_role
-    save_data(users_path, users)
+    users_log.upsert(user)
     flash("Permissões atualizadas", "success")
     destination = request.form.get("redirect_to") or url_for("dashboard", tab="settings")
     return redirect(destination)
@@ -1325,12 +1848,12 @@ def update_user_role(user_id):
 @login_required
 @require_permission("manage_users")
 def toggle_user_access(user_id):
-    user = next((u for u in users if u.get("id") == user_id), None)
+    user = users_by_id.get(user_id)
     if not user:
         flash("Usuário não encontrado", "danger")
         return redirect(url_for("dashboard", tab="settings"))
     user["portal_enabled"] = not user.get("portal_enabled", True)
-    save_data(users_path, users)
+    users_log.upsert(user)
     flash("Acesso atualizado", "info")
     destination = request.form.get("redirect_to") or url_for("dashboard", tab="settings")
     return redirect(destination)
@@ -1340,27 +1863,29 @@ def toggle_user_access(user_id):
 @login_required
 @require_permission("manage_users")
 def update_user(user_id):
-    user = next((u for u in users if u.get("id") == user_id), None)
+    form = request.form
+    user = users_by_id.get(user_id)
     if not user:
         flash("Usuário não encontrado", "danger")
         return redirect(url_for("dashboard", tab="settings"))
-    new_username = request.form.get("username")
+    new_username = form.get("username")
     if new_username and new_username != user.get("username"):
         if find_user_by_username(new_username):
             flash("Outro usuário já utiliza esse login", "danger")
             return redirect(url_for("dashboard", tab="settings"))
-        user["username"] = new_username
-    user["name"] = request.form.get("name") or user.get("name")
-    new_role = request.form.get("role") or user.get("role")
+        set_username(user, new_username)
+    user["name"] = form.get("name") or user.get("name")
+    set_sort_key(user)
+    new_role = form.get("role") or user.get("role")
     if not find_role(new_role):
         flash("Cargo inválido", "danger")
         return redirect(url_for("dashboard", tab="settings"))
     user["role"] = new_role
-    password = request.form.get("password") or None
+    password = form.get("password") or None
     if password:
-        user["password_hash"] = generate_password_hash(password)
-    user["portal_enabled"] = request.form.get("portal_enabled") == "on"
-    save_data(users_path, users)
+        user["password_hash"] = hash_password(password)
+    user["portal_enabled"] = form.get("portal_enabled") == "on"
+    users_log.upsert(user)
     flash("Usuário atualizado", "success")
     return redirect(url_for("dashboard", tab="settings"))
 
@@ -1369,37 +1894,41 @@ def update_user(user_id):
 @login_required
 @require_permission("manage_users")
 def delete_user(user_id):
-    global users
-    users = [u for u in users if u.get("id") != user_id]
+    user = users_by_id.pop(user_id, None)
+    if user:
+        users.remove(user)
+        users_by_username.pop(user.get("username"), None)
+        users_log.delete(user_id)
     for student in students:
         if student.get("user_id") == user_id:
             student["user_id"] = None
             student["portal_enabled"] = False
-    save_data(users_path, users)
-    save_data(students_path, students)
+            students_log.upsert(student)
     flash("Usuário removido", "info")
     return redirect(url_for("dashboard", tab="settings"))
 
 
 @app.route("/departments/apply/<token>", methods=["GET", "POST"])
 def apply_department(token):
-    department = next((d for d in departments if d.get("join_token") == token), None)
+    form = request.form
+    department = departments_by_token.get(token)
     if not department:
         flash("Link de inscrição inválido", "danger")
         return redirect(url_for("login"))
 
     if request.method == "POST":
         request_entry = {
-            "id": str(uuid.uuid4()),
-            "name": request.form.get("name"),
-            "contact": request.form.get("contact"),
-            "desired_role": request.form.get("desired_role"),
-            "motivation": request.form.get("motivation"),
+            "id": new_id(),
+            "name": form.get("name"),
+            "contact": form.get("contact"),
+            "desired_role": form.get("desired_role"),
+            "motivation": form.get("motivation"),
             "status": "pendente",
-            "created_at": datetime.utcnow().isoformat(),
+            "created_at": request_now(),
         }
         department.setdefault("queue", []).append(request_entry)
-        save_data(departments_path, departments)
+        queue_entries[(department["id"], request_entry["id"])] = request_entry
+        departments_log.upsert(department)
         flash("Solicitação registrada! Aguarde o retorno do diretor.", "success")
         return redirect(url_for("apply_department", token=token))
 
@@ -1410,20 +1939,21 @@ def apply_department(token):
 @login_required
 @require_permission("manage_settings")
 def update_settings():
+    form = request.form
     logo_file = request.files.get("logo_file")
     if logo_file and logo_file.filename:
         if not allowed_file(logo_file.filename, ALLOWED_IMAGE_EXTENSIONS):
             flash("Envie uma imagem válida para o logo", "danger")
             return redirect(url_for("dashboard", tab="settings"))
-        filename = f"{uuid.uuid4()}_{secure_filename(logo_file.filename)}"
+        filename = f"{new_id()}_{secure_filename(logo_file.filename)}"
         destination = os.path.join(app.config["UPLOAD_FOLDER_LOGOS"], filename)
-        logo_file.save(destination)
+        save_upload(logo_file, destination)
         site_settings["logo_file"] = filename
         site_settings["logo_url"] = ""
-    site_settings["logo_url"] = request.form.get("logo_url", site_settings.get("logo_url", ""))
-    site_settings["primary_color"] = request.form.get("primary_color", "#0d6efd")
-    site_settings["accent_color"] = request.form.get("accent_color", "#6610f2")
-    site_settings["tagline"] = request.form.get("tagline", site_settings.get("tagline"))
+    site_settings["logo_url"] = form.get("logo_url", site_settings.get("logo_url", ""))
+    site_settings["primary_color"] = form.get("primary_color", "#0d6efd")
+    site_settings["accent_color"] = form.get("accent_color", "#6610f2")
+    site_settings["tagline"] = form.get("tagline", site_settings.get("tagline"))
     save_data(site_settings_path, site_settings)
     flash("Configurações visuais atualizadas", "success")
     return redirect(url_for("dashboard", tab="settings"))
@@ -1433,17 +1963,16 @@ def update_settings():
 @login_required
 @require_permission("manage_settings")
 def update_dashboard_widgets():
-    widgets = normalized_widgets()
-    updated = []
-    for widget in widgets:
-        widget_id = widget.get("id")
-        widget["enabled"] = request.form.get(f"enabled_{widget_id}") == "on"
-        widget["title"] = request.form.get(f"title_{widget_id}") or widget.get("title")
-        widget["subtitle"] = request.form.get(f"subtitle_{widget_id}") or widget.get(
-            "subtitle"
-        )
-        updated.append(widget)
-    site_settings["widgets"] = updated
+    form = request.form
+    site_settings["widgets"] = [
+        {
+            **widget,
+            "enabled": form.get(f"enabled_{widget['id']}") == "on",
+            "title": form.get(f"title_{widget['id']}") or widget.get("title"),
+            "subtitle": form.get(f"subtitle_{widget['id']}") or widget.get("subtitle"),
+        }
+        for widget in normalized_widgets()
+    ]
     save_data(site_settings_path, site_settings)
     flash("Widgets atualizados com sucesso", "success")
     return redirect(url_for("dashboard", tab="settings"))
@@ -1451,7 +1980,7 @@ def update_dashboard_widgets():
 
 @app.route("/approve/<token>", methods=["GET", "POST"])
 def approve_journal(token):
-    journal = next((j for j in journals if j.get("approval_token") == token), None)
+    journal = journals_by_approval.get(token)
     if not journal:
         flash("Solicitação não encontrada", "danger")
         return redirect(url_for("login"))
@@ -1465,7 +1994,7 @@ def approve_journal(token):
         elif action == "reject":
             journal["status"] = "rejeitado"
             journal["approval_reason"] = reason or "Sem justificativa"
-        save_data(journals_path, journals)
+        journals_log.upsert(journal)
         flash("Avaliação registrada", "success")
         return redirect(url_for("approve_journal", token=token))
 